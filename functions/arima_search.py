@@ -0,0 +1,232 @@
+"""
+Parallel search of ARIMA orders for several series at once.
+
+auto_arima's stepwise search fits one candidate after the other, for one series
+at a time. Here the candidate (p,d,q)(P,D,Q) orders of all the series are fitted
+together on a pool of processes, the simplest candidates first. A series stops
+searching when its best information criterion has not improved for a few rounds,
+and the whole search stops when its time budget runs out, fits still running
+included.
+"""
+
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+import numpy as np
+import pandas as pd
+from pmdarima.arima import ARIMA, ndiffs
+
+
+def candidate_orders(max_p=3, max_q=3, max_P=2, max_Q=2, d=1, D=1, m=12):
+    """
+    Lists the candidate orders, grouped in rounds of the same complexity (p+q+P+Q).
+    Parameters
+    ----------------
+    max_p, max_q, max_P, max_Q: int
+        Largest non-seasonal and seasonal AR and MA orders
+    d, D: int
+        Non-seasonal and seasonal differencing orders
+    m: int
+        Period of the seasonality
+    Returns
+    ----------------
+    list
+        One list of (order, seasonal_order) tuples per round
+    """
+    rounds = {}
+    for p in range(max_p + 1):
+        for q in range(max_q + 1):
+            for P in range(max_P + 1):
+                for Q in range(max_Q + 1):
+                    rounds.setdefault(p + q + P + Q, []).append(
+                        ((p, d, q), (P, D, Q, m))
+                    )
+    return [rounds[complexity] for complexity in sorted(rounds)]
+
+
+def _fit(y, order, seasonal_order, information_criterion):
+    """
+    Fits one candidate in a worker and returns its criterion, the model and the time it took.
+    """
+    start = time.perf_counter()
+    model = ARIMA(order=order, seasonal_order=seasonal_order, suppress_warnings=True)
+    model.fit(y)
+    criterion = getattr(model, information_criterion)()
+    return criterion, model, time.perf_counter() - start
+
+
+def _worker(connection):
+    """
+    Fits the candidates received through a pipe until it receives None.
+    Every worker has its own pipe, so killing it cannot break the others.
+    """
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        try:
+            connection.send((_fit(*task), None))
+        except Exception as error:
+            connection.send((None, str(error)))
+
+
+def _start_workers(n_workers: int):
+    """
+    Starts the worker processes, returns (process, connection) pairs.
+    """
+    workers = []
+    for _ in range(n_workers):
+        connection, worker_end = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_worker, args=(worker_end,), daemon=True
+        )
+        process.start()
+        worker_end.close()
+        workers.append((process, connection))
+    return workers
+
+
+def search(
+    targets: dict,
+    m: int = 12,
+    D: int = 1,
+    max_p: int = 3,
+    max_q: int = 3,
+    max_P: int = 2,
+    max_Q: int = 2,
+    time_budget: float = 30,
+    patience: int = 2,
+    tolerance: float = 2,
+    information_criterion: str = "aic",
+    n_jobs: int = -1,
+):
+    """
+    Searches the best ARIMA order of every target series in parallel.
+    The non-seasonal differencing order of each series is chosen with a KPSS test,
+    like auto_arima does.
+    Parameters
+    ----------------
+    targets: dict
+        Series to model, by name
+    m: int
+        Period of the seasonality
+    D: int
+        Seasonal differencing order
+    max_p, max_q, max_P, max_Q: int
+        Largest non-seasonal and seasonal AR and MA orders
+    time_budget: float
+        Seconds of wall time the search may take; when they run out, the fits still
+        running are stopped and the best models found so far are returned
+    patience: int
+        Number of rounds without improvement after which a target stops searching
+    tolerance: float
+        Smallest decrease of the criterion counted as an improvement
+    information_criterion: str
+        "aic", "aicc", "bic" or "hqic"
+    n_jobs: int
+        Number of processes, -1 uses all the cores
+    Raises
+    ----------------
+    ValueError
+        If no candidate could be fitted for a target
+    Returns
+    ----------------
+    tuple
+        The best fitted model of every target (dict) and a report of the
+        candidates tried (pandas dataframe)
+    Example
+    ----------------
+    models, report = search({"total_consumption": data}, time_budget=10)
+    """
+    deadline = time.perf_counter() + time_budget
+    series = {name: np.asarray(y, dtype=float) for name, y in targets.items()}
+    rounds = {
+        name: candidate_orders(
+            max_p, max_q, max_P, max_Q, ndiffs(y, test="kpss", max_d=2), D, m
+        )
+        for name, y in series.items()
+    }
+    best = {name: (np.inf, None) for name in series}
+    stale = {name: 0 for name in series}
+    report = []
+
+    n_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+    workers = _start_workers(n_workers)
+    idle = [connection for _, connection in workers]
+    try:
+        for round_number in range(max(len(r) for r in rounds.values())):
+            active = [
+                name
+                for name in series
+                if stale[name] < patience and round_number < len(rounds[name])
+            ]
+            if not active or time.perf_counter() >= deadline:
+                break
+            candidates = [
+                (name, order, seasonal)
+                for name in active
+                for order, seasonal in rounds[name][round_number]
+            ]
+            previous = {name: best[name][0] for name in active}
+
+            waiting = list(candidates)
+            running = {}
+            while running or (waiting and idle):
+                while waiting and idle:
+                    connection = idle.pop()
+                    name, order, seasonal = running[connection] = waiting.pop(0)
+                    connection.send(
+                        (series[name], order, seasonal, information_criterion)
+                    )
+                remaining = deadline - time.perf_counter()
+                ready = wait(list(running), timeout=max(remaining, 0))
+                if not ready:
+                    break
+                for connection in ready:
+                    name, order, seasonal = running.pop(connection)
+                    row = {"target": name, "order": order, "seasonal_order": seasonal}
+                    try:
+                        result, error = connection.recv()
+                    except EOFError:
+                        # The worker died, e.g. out of memory; it gets no more candidates
+                        result, error = None, "The worker process died."
+                    else:
+                        idle.append(connection)
+                    if error is not None:
+                        row.update(status="error", error=error)
+                    else:
+                        criterion, model, seconds = result
+                        row.update(status="ok", criterion=criterion, seconds=seconds)
+                        if criterion < best[name][0]:
+                            best[name] = (criterion, model)
+                    report.append(row)
+            unfinished = waiting + list(running.values())
+            for name, order, seasonal in candidates:
+                if (name, order, seasonal) in unfinished:
+                    report.append(
+                        {
+                            "target": name,
+                            "order": order,
+                            "seasonal_order": seasonal,
+                            "status": "timeout",
+                        }
+                    )
+
+            for name in active:
+                if previous[name] - best[name][0] < tolerance:
+                    stale[name] += 1
+                else:
+                    stale[name] = 0
+    finally:
+        # Kills the fits still running, so the search never outlasts its budget
+        for process, connection in workers:
+            process.kill()
+            process.join()
+            connection.close()
+
+    for name, (_, model) in best.items():
+        if model is None:
+            raise ValueError(f"No ARIMA order could be fitted for {name}.")
+    return {name: model for name, (_, model) in best.items()}, pd.DataFrame(report)
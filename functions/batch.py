@@ -0,0 +1,278 @@
+"""
+Command-line driver running EnergyAnalysis methods in batch.
+
+A job spec is a json file listing the countries, analyses, years and forecast
+horizons to run, for example::
+
+    {
+        "countries": ["Portugal", "Germany"],
+        "analyses": ["show_consumption", "gapminder", "forecast"],
+        "years": [1990, 2010],
+        "horizons": [5, 10]
+    }
+
+Every combination an analysis needs becomes one job. The jobs run on a pool of
+processes; each finished job is appended to a checkpoint file (one json object
+per line, with its outputs, timing and the version of the dataset), so an
+interrupted run started again with the same checkpoint only runs the jobs that
+did not finish. Jobs finished on another download of the dataset run again.
+
+Usage::
+
+    python functions/batch.py spec.json --output ./batch/ --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from energy_analysis import (  # noqa: E402
+    DATA_FILE,
+    EnergyAnalysis,
+    fetch_data,
+    file_version,
+)
+from result_cache import capture_figures  # noqa: E402
+
+# Which axes of the spec each analysis runs over
+ANALYSES = {
+    "show_consumption": ("country",),
+    "consumption_country": ("country",),
+    "gdp_country": ("country",),
+    "consumption_emission_country": ("country",),
+    "gapminder": ("year",),
+    "Emissions_Consumption": ("year",),
+    "derived_metrics": ("country",),
+    "forecast": ("country", "horizon"),
+}
+
+# The analysis instance of each worker process
+_analysis = None
+
+
+def expand_jobs(spec: dict):
+    """
+    Lists the jobs described by a job spec.
+    Parameters
+    ----------------
+    spec: dict
+        With the keys "analyses" and, as the analyses need them,
+        "countries", "years" and "horizons"
+    Raises
+    ----------------
+    ValueError
+        If an analysis is unknown
+    Returns
+    ----------------
+    list
+        Dicts with the job id, the analysis and its country, year or horizon
+    """
+    axes_values = {
+        "country": spec.get("countries", []),
+        "year": spec.get("years", []),
+        "horizon": spec.get("horizons", []),
+    }
+    jobs = []
+    for analysis in spec["analyses"]:
+        if analysis not in ANALYSES:
+            raise ValueError(f"Unknown analysis '{analysis}'.")
+        combinations = [{}]
+        for axis in ANALYSES[analysis]:
+            combinations = [
+                dict(combination, **{axis: value})
+                for combination in combinations
+                for value in axes_values[axis]
+            ]
+        for params in combinations:
+            job_id = "-".join([analysis] + [str(params[a]) for a in ANALYSES[analysis]])
+            jobs.append(dict(params, id=job_id, analysis=analysis))
+    return jobs
+
+
+def read_checkpoint(path: str, data_version: str):
+    """
+    Returns the ids of the jobs a checkpoint file records as finished on a version of the dataset.
+    Parameters
+    ----------------
+    path: str
+        Path of the checkpoint file
+    data_version: str
+        Version of the dataset, see energy_analysis.file_version
+    Returns
+    ----------------
+    set
+    """
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut by an interruption, that job runs again
+                continue
+            if (
+                record.get("status") == "ok"
+                and record.get("data_version") == data_version
+            ):
+                finished.add(record["id"])
+    return finished
+
+
+def _init_worker():
+    """
+    Loads the dataset once in each worker process.
+    """
+    global _analysis
+    _analysis = EnergyAnalysis()
+
+
+def _call(job: dict):
+    """
+    Calls the EnergyAnalysis method of a job and returns what it returns.
+    """
+    analysis = job["analysis"]
+    if analysis == "show_consumption":
+        return _analysis.show_consumption(job["country"], True)
+    if analysis in ("consumption_country", "gdp_country"):
+        return getattr(_analysis, analysis)([job["country"]])
+    if analysis == "consumption_emission_country":
+        return _analysis.consumption_emission_country([job["country"]])
+    if analysis in ("gapminder", "Emissions_Consumption"):
+        return getattr(_analysis, analysis)(job["year"])
+    if analysis == "derived_metrics":
+        return _analysis.derived_metrics(countries=[job["country"]])
+    df = _analysis.df
+    iso_codes = df.loc[df["country"] == job["country"], "iso_code"].dropna()
+    if iso_codes.empty:
+        raise ValueError(f"No iso code for {job['country']}.")
+    return _analysis.forecast(job["horizon"], iso_codes.iloc[0])
+
+
+def run_job(job: dict, output: str, data_version: str = None):
+    """
+    Runs one job in a worker, saving its figure and its table (if any) in the output folder.
+    Parameters
+    ----------------
+    job: dict
+        A job from expand_jobs
+    output: str
+        Output folder
+    data_version: str
+        Version of the dataset the job runs on, recorded with it
+    Returns
+    ----------------
+    dict
+        The job with its status, outputs and timing in seconds
+    """
+    record = dict(job, data_version=data_version)
+    start = time.perf_counter()
+    try:
+        with capture_figures() as created:
+            result = _call(job)
+        if created:
+            figure = os.path.join(output, "figures", job["id"] + ".png")
+            plt.gcf().savefig(figure, bbox_inches="tight")
+            record["figure"] = figure
+        if hasattr(result, "to_csv"):
+            table = os.path.join(output, "tables", job["id"] + ".csv")
+            result.to_csv(table, index=False)
+            record["table"] = table
+        record["status"] = "ok"
+    except Exception as error:
+        record["status"] = "error"
+        record["error"] = "".join(traceback.format_exception_only(type(error), error))
+    finally:
+        plt.close("all")
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run(spec: dict, output: str, workers: int = None, checkpoint: str = None):
+    """
+    Runs the jobs of a spec that are not finished yet on a pool of processes.
+    Parameters
+    ----------------
+    spec: dict
+        The job spec
+    output: str
+        Output folder for the figures, tables and (by default) the checkpoint
+    workers: int
+        Number of processes, all the cores if None
+    checkpoint: str
+        Checkpoint file, output/checkpoint.jsonl if None
+    Returns
+    ----------------
+    list
+        The records of the jobs run now
+    Example
+    ----------------
+    run({"countries": ["Portugal"], "analyses": ["forecast"], "horizons": [5]}, "./batch/")
+    """
+    for folder in ("figures", "tables"):
+        os.makedirs(os.path.join(output, folder), exist_ok=True)
+    if checkpoint is None:
+        checkpoint = os.path.join(output, "checkpoint.jsonl")
+
+    # Download once here, so the workers do not race to download the same file
+    fetch_data()
+    data_version = file_version(DATA_FILE)
+
+    jobs = expand_jobs(spec)
+    finished = read_checkpoint(checkpoint, data_version)
+    pending = [job for job in jobs if job["id"] not in finished]
+    print(
+        f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, "
+        f"{len(pending)} to run",
+        file=sys.stderr,
+    )
+
+    records = []
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool, open(
+        checkpoint, "a"
+    ) as log:
+        futures = [pool.submit(run_job, job, output, data_version) for job in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            log.write(json.dumps(record) + "\n")
+            log.flush()
+            records.append(record)
+            print(
+                f"[{done}/{len(pending)}] {record['id']} {record['status']} "
+                f"{record['seconds']}s",
+                file=sys.stderr,
+            )
+    return records
+
+
+def main(argv: list = None):
+    """
+    Command-line entry point, see the module docstring.
+    """
+    parser = argparse.ArgumentParser(description="Run energy analyses in batch.")
+    parser.add_argument("spec", help="json file with the job spec")
+    parser.add_argument("--output", default="./batch/", help="output folder")
+    parser.add_argument("--workers", type=int, default=None, help="processes")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    records = run(spec, args.output, args.workers, args.checkpoint)
+    failed = [record for record in records if record["status"] != "ok"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+Data-quality stage applied once when the dataset is loaded.
+
+The scan flags, for every country and year, the interior gaps, the missing
+values at the ends of a series, the zeros, the outliers and the rows of regions
+and other aggregates. It works on whole columns at once, with the rows ordered
+by country and year. The gaps are then interpolated once, so the analysis
+methods do not need to clean the data on every call.
+"""
+
+import inspect
+
+import numpy as np
+import pandas as pd
+
+# Rows of the dataset that are regions or groups of countries, not countries
+REGIONS = [
+    "Africa",
+    "Asia Pacific",
+    "CIS",
+    "Central America",
+    "Eastern Africa",
+    "Europe",
+    "Europe (other)",
+    "Middle Africa",
+    "Middle East",
+    "North America",
+    "OPEC",
+    "Other Asia & Pacific",
+    "Other CIS",
+    "Other Caribbean",
+    "Other Middle East",
+    "Other Northern Africa",
+    "Other South America",
+    "Other Southern Africa",
+    "South & Central America",
+    "USSR",
+    "Western Africa",
+    "Western Sahara",
+    "World",
+]
+
+# Columns scanned by default
+QUALITY_COLUMNS = [
+    "biofuel_consumption",
+    "coal_consumption",
+    "gas_consumption",
+    "hydro_consumption",
+    "nuclear_consumption",
+    "oil_consumption",
+    "other_renewable_consumption",
+    "solar_consumption",
+    "wind_consumption",
+    "gdp",
+    "population",
+]
+
+
+class QualityReport:
+    """
+    Masks produced by the quality scan, indexed like the scanned dataset.
+    Attributes
+    ----------------
+    gaps: pandas.DataFrame
+        True where a value is missing between two known values of the same country
+    missing: pandas.DataFrame
+        True where a value is missing before the first or after the last known value
+    zeros: pandas.DataFrame
+        True where a value is exactly 0
+    outliers: pandas.DataFrame
+        True where a value is far from the median of its neighbouring years
+    aggregate: pandas.Series
+        True for the rows of regions and other aggregates
+    no_consumption: pandas.Series
+        True for the rows without any consumption value
+    filled: pandas.DataFrame
+        True where a value was interpolated (gaps and replaced outliers)
+    """
+
+    def __init__(self, gaps, missing, zeros, outliers, aggregate, no_consumption):
+        self.gaps = gaps
+        self.missing = missing
+        self.zeros = zeros
+        self.outliers = outliers
+        self.aggregate = aggregate
+        self.no_consumption = no_consumption
+        self.filled = pd.DataFrame(False, index=gaps.index, columns=gaps.columns)
+
+    def reindex(self, index):
+        """
+        Returns the report for other rows, e.g. after the dataset was filtered or
+        extended; rows that were not scanned get False everywhere.
+        Parameters
+        ----------------
+        index: pandas index
+            Index of the rows to keep
+        Returns
+        ----------------
+        QualityReport
+        """
+        report = QualityReport(
+            *(
+                mask.reindex(index, fill_value=False)
+                for mask in (
+                    self.gaps,
+                    self.missing,
+                    self.zeros,
+                    self.outliers,
+                    self.aggregate,
+                    self.no_consumption,
+                )
+            )
+        )
+        report.filled = self.filled.reindex(index, fill_value=False)
+        return report
+
+    def combine(self, other):
+        """
+        Returns the report with the rows of another report replacing or added to its own,
+        e.g. after some countries were scanned again.
+        Parameters
+        ----------------
+        other: QualityReport
+            Report of the rows to replace or add
+        Returns
+        ----------------
+        QualityReport
+        """
+        index = self.gaps.index.append(other.gaps.index.difference(self.gaps.index))
+
+        def merged(name):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            kept = mine.drop(index=theirs.index, errors="ignore")
+            return pd.concat([kept, theirs]).reindex(index)
+
+        names = ["gaps", "missing", "zeros", "outliers", "aggregate", "no_consumption"]
+        report = QualityReport(*(merged(name) for name in names))
+        report.filled = merged("filled")
+        return report
+
+    def summary(self):
+        """
+        Counts the flagged values of every scanned column.
+        Parameters
+        ----------------
+        None
+        Returns
+        ----------------
+        pandas dataframe
+        """
+        return pd.DataFrame(
+            {
+                "gaps": self.gaps.sum(),
+                "missing": self.missing.sum(),
+                "zeros": self.zeros.sum(),
+                "outliers": self.outliers.sum(),
+                "filled": self.filled.sum(),
+            }
+        )
+
+
+def _inside(known: pd.DataFrame, country: pd.Series):
+    """
+    True where a country has known values both before and after, rows ordered by year.
+    """
+    before = known.astype("int8").groupby(country).cummax().astype(bool)
+    after = known[::-1].astype("int8").groupby(country[::-1]).cummax()[::-1]
+    return before & after.astype(bool)
+
+
+def _interpolate(values, to_fill, country, year, method, options):
+    """
+    Interpolates the values to fill of every country over its own years, so no
+    method uses the values of another country. A series too short for the method
+    (e.g. a cubic spline through three values) is interpolated linearly.
+    """
+    if hasattr(year, "dt"):
+        year = year.dt.year
+    result = values.copy()
+    needed = to_fill.any(axis=1).groupby(country).transform("any")
+    for _, part in values[needed].groupby(country[needed], sort=False):
+        columns = part.columns[to_fill.loc[part.index].any()]
+        series = part[columns].set_axis(year.loc[part.index].to_numpy())
+        try:
+            series = series.interpolate(method=method, **options)
+        except ValueError:
+            series = series.interpolate(method="linear")
+        result.loc[part.index, columns] = series.to_numpy()
+    return result
+
+
+def scan(df: pd.DataFrame, columns: list = None, outlier_ratio: float = 3, window=5):
+    """
+    Flags gaps, missing values, zeros, outliers and aggregate rows.
+    A value is an outlier when it is more than outlier_ratio times above (or below)
+    the median of the window of years around it.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        The dataset, with the country and year columns
+    columns: list
+        Columns to scan, QUALITY_COLUMNS by default
+    outlier_ratio: float
+        How far from the local median a value must be to be an outlier
+    window: int
+        Number of years of the local median
+    Returns
+    ----------------
+    QualityReport
+    Example
+    ----------------
+    report = scan(object.df)
+    """
+    if columns is None:
+        columns = [column for column in QUALITY_COLUMNS if column in df.columns]
+    ordered = df.sort_values(["country", "year"])
+    values = ordered[columns]
+    country = ordered["country"]
+
+    known = values.notna()
+    inside = _inside(known, country)
+    gaps = ~known & inside
+    missing = ~known & ~inside
+    zeros = values == 0
+
+    logs = np.log1p(values.clip(lower=0))
+    local = (
+        logs.groupby(country)
+        .rolling(window, center=True, min_periods=1)
+        .median()
+        .droplevel(0)
+        .reindex(logs.index)
+    )
+    outliers = (logs - local).abs() > np.log(outlier_ratio)
+
+    consumption = [column for column in columns if column.endswith("_consumption")]
+    report = QualityReport(
+        gaps,
+        missing,
+        zeros,
+        outliers,
+        country.isin(REGIONS),
+        ~known[consumption].any(axis=1),
+    )
+    return report.reindex(df.index)
+
+
+def fill(
+    df: pd.DataFrame,
+    report: QualityReport,
+    interpolation: str = "linear",
+    replace_outliers: bool = False,
+    fill_value: float = 0,
+    interpolation_options: dict = None,
+):
+    """
+    Interpolates the gaps flagged by a scan (and optionally the outliers)
+    and fills the missing consumptions with a constant. Every country is
+    interpolated over its own years.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        The scanned dataset
+    report: QualityReport
+        The result of scan(df); its filled mask is updated
+    interpolation: str
+        Method of pandas.DataFrame.interpolate, None to leave the gaps
+    replace_outliers: bool
+        Whether the outliers between two other values of the country are also
+        replaced by interpolated values
+    fill_value: float
+        Value of the missing consumptions, None to leave them missing
+    interpolation_options: dict
+        Other arguments of pandas.DataFrame.interpolate, e.g. {"order": 2}
+        for the "spline" and "polynomial" methods
+    Returns
+    ----------------
+    pandas dataframe
+    Example
+    ----------------
+    df = fill(df, scan(df))
+    """
+    columns = list(report.gaps.columns)
+    df = df.copy()
+    ordered = df.sort_values(["country", "year"])
+    values = ordered[columns]
+    country = ordered["country"]
+
+    if interpolation is not None:
+        masked = values
+        if replace_outliers:
+            masked = values.mask(report.outliers.loc[values.index])
+        # Outliers in the first or last years cannot be interpolated and keep their value
+        to_fill = masked.isna() & _inside(masked.notna(), country)
+        interpolated = _interpolate(
+            masked,
+            to_fill,
+            country,
+            ordered["year"],
+            interpolation,
+            interpolation_options or {},
+        )
+        values = values.where(~to_fill, interpolated)
+        report.filled = to_fill.reindex(df.index)
+    df[columns] = values.reindex(df.index)
+
+    if fill_value is not None:
+        consumption = [column for column in columns if column.endswith("_consumption")]
+        df[consumption] = df[consumption].fillna(fill_value)
+    return df
+
+
+def assess(df: pd.DataFrame, columns: list = None, **options):
+    """
+    Scans the dataset and fills it in one go.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        The dataset
+    columns: list
+        Columns to scan, QUALITY_COLUMNS by default
+    **options:
+        outlier_ratio and window for scan; interpolation, replace_outliers,
+        fill_value and interpolation_options for fill
+    Returns
+    ----------------
+    tuple
+        The filled dataframe and its QualityReport
+    """
+    scan_options = {
+        k: options.pop(k) for k in ("outlier_ratio", "window") if k in options
+    }
+    report = scan(df, columns, **scan_options)
+    return fill(df, report, **options), report
+
+
+def reassess(df: pd.DataFrame, report: QualityReport, changed, **options):
+    """
+    Runs the quality stage again on rows of a dataset that changed, e.g. to fill
+    the gaps around updated values. The values the stage filled before are cleared
+    first, unless they were changed, so they are filled again from the new values.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        The rows to assess (whole countries), filled once and with the changes applied
+    report: QualityReport
+        The report of the dataset before the change
+    changed: pandas dataframe
+        True for the changed or added values, e.g. updated_rows.notna()
+    **options:
+        Options of assess
+    Returns
+    ----------------
+    tuple
+        The filled rows and the report of the whole dataset, updated for those rows
+    """
+    old = report.reindex(df.index)
+    columns = list(old.gaps.columns)
+    changed = changed.reindex(index=df.index, columns=columns, fill_value=False)
+    changed = changed.fillna(False).astype(bool)
+    raw = df.copy()
+    raw[columns] = df[columns].mask((old.filled | old.missing) & ~changed)
+    df, new = assess(raw, **dict(options, columns=columns))
+    # Outliers replaced before are gaps of the cleared values, they stay outliers
+    replaced = old.outliers & old.filled & ~changed
+    new.outliers = new.outliers | replaced
+    new.gaps = new.gaps & ~replaced
+    return df, report.combine(new)
+
+
+def effective_options(**options):
+    """
+    Completes options of assess with the defaults of scan and fill, so equal
+    configurations compare equal however they were written.
+    Parameters
+    ----------------
+    **options:
+        Options of assess
+    Returns
+    ----------------
+    dict
+    """
+    effective = {}
+    for function in (scan, fill):
+        for name, parameter in inspect.signature(function).parameters.items():
+            if parameter.default is not inspect.Parameter.empty:
+                effective[name] = parameter.default
+    effective.update(options)
+    return effective
@@ -0,0 +1,272 @@
+"""
+Derived metrics computed from the energy dataset.
+
+Every metric declares the columns (or other metrics) it is computed from, which
+makes the metrics a dependency graph. Metrics are computed lazily, on whole
+columns at once, and kept in memory. When some rows of the data change, only
+those rows of the affected metrics are recomputed, the next time they are read.
+"""
+
+import pandas as pd
+
+
+class Metric:
+    """
+    Definition of a derived metric.
+    Attributes
+    ----------------
+    name: str
+        Name of the metric
+    inputs: list
+        Columns of the dataset or names of other metrics the metric is computed from
+    function: callable
+        Takes a dataframe with the inputs as columns and returns a series with the same index
+    by_country: bool
+        True if the value of a row depends on the other rows of its country
+        (e.g. year-over-year changes), so a change recomputes the whole country
+    """
+
+    def __init__(self, name: str, inputs: list, function, by_country: bool = False):
+        self.name = name
+        self.inputs = inputs
+        self.function = function
+        self.by_country = by_country
+
+
+def _ratio(numerator: str, denominator: str, scale: float = 1):
+    """
+    Returns a function dividing two columns, with NaN where the denominator is 0.
+    """
+
+    def function(df):
+        return df[numerator] * scale / df[denominator].where(df[denominator] != 0)
+
+    return function
+
+
+def _growth(column: str):
+    """
+    Returns a function computing the year-over-year relative change of a column in each country.
+    """
+
+    def function(df):
+        ordered = df.sort_values("year")
+        previous = ordered.groupby("country")[column].shift(1)
+        growth = ordered[column] / previous.where(previous != 0) - 1
+        return growth.reindex(df.index)
+
+    return function
+
+
+# Consumptions are in terawatt-hours (1e9 kWh) and emissions in tonnes of CO2
+METRICS = [
+    Metric(
+        "consumption_per_capita",
+        ["total_consumption", "population"],
+        _ratio("total_consumption", "population", 1e9),
+    ),
+    Metric(
+        "energy_intensity",
+        ["total_consumption", "gdp"],
+        _ratio("total_consumption", "gdp", 1e9),
+    ),
+    Metric(
+        "emissions_intensity",
+        ["total_emissions", "gdp"],
+        _ratio("total_emissions", "gdp"),
+    ),
+    Metric(
+        "carbon_per_twh",
+        ["total_emissions", "total_consumption"],
+        _ratio("total_emissions", "total_consumption"),
+    ),
+    Metric(
+        "gdp_growth",
+        ["country", "year", "gdp"],
+        _growth("gdp"),
+        by_country=True,
+    ),
+    Metric(
+        "consumption_growth",
+        ["country", "year", "total_consumption"],
+        _growth("total_consumption"),
+        by_country=True,
+    ),
+    Metric(
+        "emissions_growth",
+        ["country", "year", "total_emissions"],
+        _growth("total_emissions"),
+        by_country=True,
+    ),
+    # Decoupling elasticities: below 1 the economy grows faster than its
+    # consumption (or emissions), below 0 they fall while the economy grows
+    Metric(
+        "consumption_decoupling",
+        ["consumption_growth", "gdp_growth"],
+        _ratio("consumption_growth", "gdp_growth"),
+    ),
+    Metric(
+        "emissions_decoupling",
+        ["emissions_growth", "gdp_growth"],
+        _ratio("emissions_growth", "gdp_growth"),
+    ),
+]
+
+
+class DerivedMetrics:
+    """
+    Lazily computes the derived metrics of a dataset and keeps them up to date.
+    Attributes
+    ----------------
+    df: pandas.DataFrame
+        The dataset the metrics are computed from
+    metrics: dict
+        The Metric definitions by name
+    Methods
+    ----------------
+    get: Get method
+        Returns the values of a metric, computing only what is missing or outdated
+    frame: Frame method
+        Returns several metrics next to the country and year columns
+    update: Update method
+        Changes or adds rows of the dataset and marks the affected metric rows as outdated
+    """
+
+    def __init__(self, df: pd.DataFrame, metrics: list = None):
+        """
+        Class constructor to inizialize the attributes of the class.
+        Parameters
+        ----------------
+        df: pandas dataframe
+            The dataset, with at least the country and year columns
+        metrics: list
+            Metric definitions, METRICS by default
+        Raises
+        ----------------
+        ValueError
+            If a metric depends on an unknown column or metric, or on itself
+        """
+        self.df = df
+        self.metrics = {metric.name: metric for metric in metrics or METRICS}
+        self._values = {}
+        self._outdated = {}
+        self._order = []
+        for name in self.metrics:
+            self._visit(name, [])
+
+    def _visit(self, name: str, path: list):
+        """
+        Adds a metric after its dependencies to the evaluation order and checks the graph.
+        """
+        if name in self._order or name not in self.metrics:
+            return
+        if name in path:
+            raise ValueError(f"Metric '{name}' depends on itself.")
+        for dependency in self.metrics[name].inputs:
+            if dependency not in self.metrics and dependency not in self.df.columns:
+                raise ValueError(f"Metric '{name}' needs the unknown '{dependency}'.")
+            self._visit(dependency, path + [name])
+        self._order.append(name)
+
+    def _inputs(self, metric: Metric, index=None):
+        """
+        Returns the inputs of a metric as a dataframe, only some rows if an index is given.
+        """
+        columns = {}
+        for dependency in metric.inputs:
+            values = self.get(dependency)
+            columns[dependency] = values if index is None else values.loc[index]
+        return pd.DataFrame(columns)
+
+    def get(self, name: str):
+        """
+        Returns the values of a metric (or of a column of the dataset).
+        Parameters
+        ----------------
+        name: str
+            Name of the metric
+        Raises
+        ----------------
+        KeyError
+            If the name is neither a metric nor a column
+        Returns
+        ----------------
+        pandas series
+        Example
+        ----------------
+        metrics.get("energy_intensity")
+        """
+        if name not in self.metrics:
+            return self.df[name]
+        metric = self.metrics[name]
+        if name not in self._values:
+            self._values[name] = metric.function(self._inputs(metric)).rename(name)
+            self._outdated.pop(name, None)
+        elif name in self._outdated:
+            index = self._outdated.pop(name)
+            self._values[name].loc[index] = metric.function(self._inputs(metric, index))
+        return self._values[name]
+
+    def frame(self, names: list = None):
+        """
+        Returns metrics as columns next to the country and year of each row.
+        Parameters
+        ----------------
+        names: list
+            Names of the metrics, all of them if None
+        Returns
+        ----------------
+        pandas dataframe
+        Example
+        ----------------
+        metrics.frame(["consumption_per_capita", "emissions_decoupling"])
+        """
+        if names is None:
+            names = list(self.metrics)
+        columns = {"country": self.df["country"], "year": self.df["year"]}
+        columns.update({name: self.get(name) for name in names})
+        return pd.DataFrame(columns)
+
+    def update(self, rows: pd.DataFrame):
+        """
+        Writes rows into the dataset, replacing the rows with the same index and
+        appending the new ones. The metrics already computed are only recomputed,
+        lazily, for the rows affected by the change.
+        Parameters
+        ----------------
+        rows: pandas dataframe
+            New values, indexed like the dataset; only the changed columns are needed
+            for existing rows
+        Returns
+        ----------------
+        None
+        Example
+        ----------------
+        metrics.update(new_rows)
+        """
+        new_index = rows.index.difference(self.df.index)
+        old_index = rows.index.intersection(self.df.index)
+        if len(old_index):
+            self.df.loc[old_index, rows.columns] = rows.loc[old_index]
+        if len(new_index):
+            self.df = pd.concat([self.df, rows.loc[new_index]])
+            for name in self._values:
+                self._values[name] = self._values[name].reindex(self.df.index)
+
+        # Walk the graph in dependency order to find the rows each metric loses
+        empty = self.df.index[:0]
+        changed = {column: rows.index for column in rows.columns}
+        for column in self.df.columns.difference(rows.columns):
+            changed[column] = new_index
+        for name in self._order:
+            metric = self.metrics[name]
+            index = empty
+            for dependency in metric.inputs:
+                index = index.union(changed.get(dependency, empty))
+            if metric.by_country and len(index):
+                countries = self.df.loc[index, "country"].unique()
+                index = self.df.index[self.df["country"].isin(countries)]
+            changed[name] = index
+            if name in self._values and len(index):
+                previous = self._outdated.get(name, empty)
+                self._outdated[name] = previous.union(index)
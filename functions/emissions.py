@@ -0,0 +1,75 @@
+"""
+Emissions and total consumption of the energy dataset.
+
+Kept apart from energy_analysis, so that the workers processing partitions
+do not have to import the forecasting and plotting libraries.
+"""
+
+import hashlib
+
+# Life-cycle emission factors in grams of CO2 per kWh for each energy source
+EMISSION_FACTORS = {
+    "biofuel": 1450,
+    "coal": 1000,
+    "gas": 455,
+    "hydro": 90,
+    "nuclear": 5.5,
+    "oil": 1200,
+    "solar": 53,
+    "wind": 14,
+}
+
+# Changes with any factor, so cached results computed with other factors are not reused
+EMISSION_FACTORS_VERSION = hashlib.sha256(
+    repr(sorted(EMISSION_FACTORS.items())).encode()
+).hexdigest()[:12]
+
+# Consumption columns that are aggregates of (or duplicate) the per-source ones
+AGGREGATE_CONSUMPTION = [
+    "renewables_consumption",
+    "fossil_fuel_consumption",
+    "primary_energy_consumption",
+    "low_carbon_consumption",
+]
+
+
+def add_emissions(df):
+    """
+    Adds one emission column per energy source (<source>_e) and the total_emissions column.
+    Works on any dataframe with the OWID consumption columns, so it can be applied
+    to the whole dataset or to a single partition.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        Data with the <source>_consumption columns in terawatt-hours
+    Returns
+    ----------------
+    pandas dataframe
+    """
+    # TWh -> GWh times g/kWh gives tonnes of CO2
+    emissions = {
+        source + "_e": (df[source + "_consumption"] * 1e3 * factor).values
+        for source, factor in EMISSION_FACTORS.items()
+    }
+    df = df.assign(**emissions)
+    df["total_emissions"] = df[list(emissions)].sum(axis=1)
+    return df
+
+
+def add_total_consumption(df):
+    """
+    Removes the aggregated consumption columns and adds the total_consumption column.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        Data with the OWID consumption columns
+    Returns
+    ----------------
+    pandas dataframe
+    """
+    df = df.drop(columns=AGGREGATE_CONSUMPTION, errors="ignore")
+    consumption = df.filter(regex="_consumption").drop(
+        columns="total_consumption", errors="ignore"
+    )
+    df["total_consumption"] = consumption.sum(axis=1).values
+    return df
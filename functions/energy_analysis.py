@@ -1,4 +1,5 @@
 from urllib.request import urlretrieve
+import hashlib
 import os  # we want python to be able to read what we have in our hard drive
 from statsmodels.tsa.arima.model import ARIMA
 import numpy as np
@@ -10,6 +11,57 @@ import matplotlib.pyplot as plt
 
 import seaborn as sns
 
+import arima_search
+from data_quality import REGIONS, assess, effective_options, reassess
+from derived_metrics import DerivedMetrics
+from emissions import EMISSION_FACTORS_VERSION, add_emissions, add_total_consumption
+from result_cache import ResultCache
+
+# Where the dataset is downloaded from and stored
+DATA_URL = (
+    "https://nyc3.digitaloceanspaces.com/owid-public/data/energy/owid-energy-data.csv"
+)
+DATA_FILE = "./downloads/energy_data.csv"
+
+
+def file_version(path: str = DATA_FILE):
+    """
+    Identifies a downloaded file, the identifier changes when it is downloaded again.
+    Parameters
+    ----------------
+    path: str
+        Path of the file
+    Returns
+    ----------------
+    str
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def fetch_data(url: str = DATA_URL, path: str = DATA_FILE):
+    """
+    Downloads the dataset unless it is already on the hard drive. The file is downloaded
+    under a temporary name and renamed when complete, so it is never read half-written.
+    Parameters
+    ----------------
+    url: str
+        Address of the file
+    path: str
+        Where to store it
+    Returns
+    ----------------
+    bool
+        True if the file was downloaded, False if it already existed
+    """
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.part"
+    urlretrieve(url, filename=temporary)
+    os.replace(temporary, path)
+    return True
+
 
 class EnergyAnalysis:
     """
@@ -24,6 +76,18 @@ class EnergyAnalysis:
         Desired name to the file
     df: pandas.DataFrame
         The padas dataframe with the content of the file downloaded
+    data_version: str
+        Identifies the downloaded file and the rows update_data changed since
+    cache: ResultCache
+        Disk cache for rendered figures and computed results, None to disable it
+    metrics: DerivedMetrics
+        Per-capita, intensity and decoupling metrics computed from df
+    quality: QualityReport
+        Gaps, zeros, outliers and aggregate rows found when the data was loaded
+    quality_options: dict
+        Options the data-quality stage ran with, defaults included
+    search_report: pandas.DataFrame
+        Candidates tried by the last forecast with search="parallel"
     Methods
     ----------------
     __init__: Init method
@@ -33,7 +97,7 @@ class EnergyAnalysis:
         and reurns a pandas dataframe with the data
     """
 
-    def __init__(self):
+    def __init__(self, cache: ResultCache = None, quality_options: dict = None):
         """
         Class constructor to inizialize the attributes of the class.
         Parameters
@@ -44,14 +108,25 @@ class EnergyAnalysis:
             The name of the output file
         df: pandas dataframe
             The columns included in the correlation matrix
+        cache: ResultCache
+            Optional disk cache used by render and cached_result
+        quality_options: dict
+            Options of data_quality.assess, e.g. {"interpolation": "linear"}
         """
 
-        self.url = "https://nyc3.digitaloceanspaces.com/owid-public/data/energy/owid-energy-data.csv"
-        self.output_file = "energy_data.csv"
+        self.url = DATA_URL
+        self.output_file = os.path.basename(DATA_FILE)
         self.df = None
+        self.data_version = None
+        self.cache = cache
+        self.search_report = None
+        self.quality_options = effective_options(**(quality_options or {}))
         self.download_file()
+        self.df, self.quality = assess(self.df, **self.quality_options)
         self.enrich_with_emission()
         self.relevant_and_total_consumption()
+        self.quality = self.quality.reindex(self.df.index)
+        self.metrics = DerivedMetrics(self.df)
 
     # method 1 --> download file and read the csv to df attribute the pandas dataframe.
     def download_file(self):
@@ -68,14 +143,9 @@ class EnergyAnalysis:
         object.download_file()
         """
         fullfilename = os.path.join("./downloads/" + self.output_file)
-        if not os.path.exists("./downloads/"):
-            os.makedirs("./downloads/")
-            urlretrieve(self.url, filename=fullfilename)
-        elif not os.path.exists(fullfilename):
-            urlretrieve(self.url, filename=fullfilename)
-        else:
-
+        if not fetch_data(self.url, fullfilename):
             print("File already exists!")
+        self.data_version = file_version(fullfilename)
         try:
             # If file doesn't exist, download it. Else, print a warning message.
 
@@ -84,6 +154,140 @@ class EnergyAnalysis:
         except Exception:
             raise Exception("Error 404") from Exception
 
+    def _cache_key(self, method: str, args: tuple, kwargs: dict):
+        """
+        Key of a method call in the cache, it changes with the dataset (and its updates),
+        the data-quality options and the emission factors.
+        """
+        quality = sorted(self.quality_options.items())
+        versions = (
+            self.data_version,
+            repr(quality),
+            EMISSION_FACTORS_VERSION,
+        )
+        return ResultCache.key(method, args, kwargs, versions)
+
+    def render(self, method: str, *args, **kwargs):
+        """
+        Returns the figure drawn by a plotting method as png bytes, drawing it
+        only if it is not in the cache yet.
+        Parameters
+        ----------------
+        method: str
+            Name of the plotting method, e.g. "gapminder"
+        *args, **kwargs:
+            Arguments of the plotting method
+        Raises
+        ----------------
+        ValueError
+            If the object has no cache
+        Returns
+        ----------------
+        bytes
+        Example
+        ----------------
+        object.render("show_consumption", "Germany", True)
+        """
+        if self.cache is None:
+            raise ValueError("No cache was given to this object.")
+        return self.cache.get_or_render(
+            self._cache_key(method, args, kwargs),
+            lambda: getattr(self, method)(*args, **kwargs),
+        )
+
+    def cached_result(self, method: str, *args, **kwargs):
+        """
+        Returns what a method returns, computing it only if it is not in the cache yet.
+        Parameters
+        ----------------
+        method: str
+            Name of the method
+        *args, **kwargs:
+            Arguments of the method
+        Raises
+        ----------------
+        ValueError
+            If the object has no cache
+        Returns
+        ----------------
+        The result of the method
+        Example
+        ----------------
+        object.cached_result("list_countries")
+        """
+        if self.cache is None:
+            raise ValueError("No cache was given to this object.")
+        return self.cache.get_or_compute(
+            self._cache_key(method, args, kwargs),
+            lambda: getattr(self, method)(*args, **kwargs),
+        )
+
+    def derived_metrics(self, names: list = None, countries: list = None):
+        """
+        Returns derived metrics (per-capita consumption, energy and emissions intensity,
+        carbon per TWh, growth and decoupling indices) for every country and year.
+        Parameters
+        ----------------
+        names: list
+            Names of the metrics, see derived_metrics.METRICS; all of them if None
+        countries: list
+            Countries to keep, all of them if None
+        Returns
+        ----------------
+        pandas dataframe
+        Example
+        ----------------
+        object.derived_metrics(["energy_intensity"], ["Portugal", "Chile"])
+        """
+        metrics = self.metrics.frame(names)
+        if countries is not None:
+            metrics = metrics[metrics["country"].isin(countries)]
+        return metrics
+
+    def update_data(self, rows: pd.DataFrame):
+        """
+        Changes or adds rows of the dataset. The data-quality stage runs again on
+        the countries of those rows, their totals are recomputed, and the derived
+        metrics only for the rows that changed.
+        Parameters
+        ----------------
+        rows: pandas dataframe
+            New values indexed like object.df; new rows need all the consumption columns
+        Returns
+        ----------------
+        None
+        Example
+        ----------------
+        object.update_data(revised_rows)
+        """
+        existing = rows.index.intersection(self.df.index)
+        appended = rows.drop(index=existing)
+        countries = set(self.df.loc[existing, "country"])
+        if len(appended):
+            countries.update(appended["country"])
+        touched = self.df[self.df["country"].isin(countries)]
+        full = pd.concat([touched, appended])
+        full.update(rows.loc[existing])
+        full, quality = reassess(
+            full, self.quality, rows.notna(), **self.quality_options
+        )
+        full = add_total_consumption(add_emissions(full))
+
+        # Only the values that differ from the current ones invalidate metrics
+        current = self.df.reindex(index=full.index, columns=full.columns)
+        differs = (full != current) & ~(full.isna() & current.isna())
+        columns = list(rows.columns) + list(full.columns[differs.any()])
+        full = full.loc[differs.any(axis=1), list(dict.fromkeys(columns))]
+        self.metrics.update(full)
+        self.df = self.metrics.df
+        self.quality = quality.reindex(self.df.index)
+        # Chained with the content of the rows, so analyses that applied the same
+        # updates to the same file share their cached results
+        content = pd.util.hash_pandas_object(rows).sum()
+        self.data_version = hashlib.sha256(
+            f"{self.data_version}-{content}".encode()
+        ).hexdigest()[:16]
+
     # method 2 --> list all the available countries
     def list_countries(self):
         """
@@ -98,32 +302,7 @@ class EnergyAnalysis:
         ----------------
         Array
         """
-        region_list = [
-            "Africa",
-            "Asia Pacific",
-            "CIS",
-            "Central America",
-            "Eastern Africa",
-            "Europe",
-            "Europe (other)",
-            "Middle Africa",
-            "Middle East",
-            "North America",
-            "OPEC",
-            "Other Asia & Pacific",
-            "Other CIS",
-            "Other Caribbean",
-            "Other Middle East",
-            "Other Northern Africa",
-            "Other South America",
-            "Other Southern Africa",
-            "South & Central America",
-            "USSR",
-            "Western Africa",
-            "Western Sahara",
-            "World",
-        ]
-        return self.df[(~self.df["country"].isin(region_list))].country.unique()
+        return self.df[(~self.df["country"].isin(REGIONS))].country.unique()
 
     # method 3 -->
     def show_consumption(self, country: str, normalize: bool):
@@ -149,7 +328,6 @@ class EnergyAnalysis:
             # selects the "_consumption" columns
             cols = [col for col in self.df.columns if "_consumption" in col]
             cols.remove("total_consumption")
-            aux = aux.fillna(value=0)
 
             norm = aux[cols]
             # normalize the consumptions values to percentages
@@ -204,11 +382,10 @@ class EnergyAnalysis:
 
         # calculate the sum of all consumption per year
 
-        # Create a dataframe for every country needed and drop NaN
+        # Create a dataframe for every country needed, without the years with no data
+        consumption_data = consumption_data[~self.quality.no_consumption]
         for i in countries:
             globals()[i] = consumption_data[consumption_data["country"] == i]
-            indexNames = globals()[i][globals()[i]["total_consumption"] < 1].index
-            globals()[i].drop(indexNames, inplace=True)
 
         # plot the total consumption
         for i in countries:
@@ -280,7 +457,6 @@ class EnergyAnalysis:
         dataframe = self.df.filter(
             regex="year|country|population|consumption|gdp|total_consumption"
         )
-        dataframe = dataframe.fillna(value=0)
 
         # Define the size of the plot for better visualization
         fig = plt.figure(figsize=(15, 10))
@@ -541,14 +717,10 @@ class EnergyAnalysis:
                 ]
             ]
 
-            # Creat a Dataframe for every Country in list "Countries" and delete the last line (51) if we have data from 2020
+            # Creat a Dataframe for every Country in list "Countries"
             for i in countries:
                 globals()[i] = consumption_data[consumption_data["country"] == i]
 
-                if len(globals()[i]) > 51:
-                    n = 1
-                    globals()[i].drop(globals()[i].tail(n).index, inplace=True)
-
             # Create two empyt list and fill it with the adjusted Country names from the list "Countries"
             df_names_consumption = []
             df_names_emission = []
@@ -615,30 +787,7 @@ class EnergyAnalysis:
 
         self.df["year"]
 
-        # Create every type of emissions columns
-        biofuel_e = self.df["biofuel_consumption"] * 1e3 * 1450
-        coal_e = self.df["coal_consumption"] * 1e3 * 1000
-        gas_e = self.df["gas_consumption"] * 1e3 * 455
-        hydro_e = self.df["hydro_consumption"] * 1e3 * 90
-        nuclear_e = self.df["nuclear_consumption"] * 1e3 * 5.5
-        oil_e = self.df["oil_consumption"] * 1e3 * 1200
-        solar_e = self.df["solar_consumption"] * 1e3 * 53
-        wind_e = self.df["wind_consumption"] * 1e3 * 14
-
-        # Assign each
-
-        self.df = self.df.assign(biofuel_e=biofuel_e.values)
-        self.df = self.df.assign(coal_e=coal_e.values)
-        self.df = self.df.assign(gas_e=gas_e.values)
-        self.df = self.df.assign(hydro_e=hydro_e.values)
-        self.df = self.df.assign(nuclear_e=nuclear_e.values)
-        self.df = self.df.assign(oil_e=oil_e.values)
-        self.df = self.df.assign(solar_e=solar_e.values)
-        self.df = self.df.assign(wind_e=wind_e.values)
-        # Sum All different types of Emissions
-        self.df["total_emissions"] = self.df[list(self.df.filter(regex="_e"))].sum(
-            axis=1
-        )
+        self.df = add_emissions(self.df)
 
     def relevant_and_total_consumption(self):
         """
@@ -655,29 +804,35 @@ class EnergyAnalysis:
         ----------------
         object.relevant_and_total_consumption()
         """
-        self.df.drop(
-            columns=[
-                "renewables_consumption",
-                "fossil_fuel_consumption",
-                "primary_energy_consumption",
-                "low_carbon_consumption",
-            ],
-            inplace=True,
-        )
-        self.df["total_consumption"] = (
-            self.df[list(self.df.filter(regex="_consumption"))].sum(axis=1).values
-        )
-
-    def forecast(self, n_periods: int, contry_code: str):
+        self.df = add_total_consumption(self.df)
+
+    def forecast(
+        self,
+        n_periods: int,
+        contry_code: str,
+        search: str = "stepwise",
+        time_budget: float = 30,
+        n_jobs: int = -1,
+    ):
         """
         This method uses an ARIMA family algorithm to make and plot predictions about the total emission and total consumption values of a given country.
         Parameters
         ----------------
         n_periods: Number of prediction periods,
         contry_code: Country identifier
+        search: "stepwise" for auto_arima's stepwise search of each series one after the other,
+            "parallel" to search the orders of both series together on a pool of processes
+            (see arima_search.search); the candidates tried are kept in object.search_report
+        time_budget: Seconds the parallel search may take
+        n_jobs: Number of processes of the parallel search, -1 uses all the cores
+        Raises
+        ----------------
+        ValueError
+            If search is neither "stepwise" nor "parallel"
         Returns
         ----------------
-        None
+        pandas dataframe
+            The forecasted total consumption and total emissions per year
         Example
         ----------------
         object.forecas(5,"PRT")
@@ -690,48 +845,65 @@ class EnergyAnalysis:
         data2 = aux["total_emissions"]
         x2 = aux["year"]
 
-        model_fit = auto_arima(
-            data,
-            start_p=1,
-            start_q=1,
-            max_p=3,
-            max_q=3,
-            m=12,
-            start_P=0,
-            seasonal=True,
-            d=None,
-            D=1,
-            trace=False,
-            error_action="ignore",  # Ignore incompatible settings
-            suppress_warnings=True,
-            stepwise=True,
-        )
+        if search == "parallel":
+            models, self.search_report = arima_search.search(
+                {"total_consumption": data, "total_emissions": data2},
+                m=12,
+                D=1,
+                max_p=3,
+                max_q=3,
+                time_budget=time_budget,
+                n_jobs=n_jobs,
+            )
+            model_fit = models["total_consumption"]
+            model_fit2 = models["total_emissions"]
+        elif search == "stepwise":
+            model_fit = auto_arima(
+                data,
+                start_p=1,
+                start_q=1,
+                max_p=3,
+                max_q=3,
+                m=12,
+                start_P=0,
+                seasonal=True,
+                d=None,
+                D=1,
+                trace=False,
+                error_action="ignore",  # Ignore incompatible settings
+                suppress_warnings=True,
+                stepwise=True,
+            )
 
-        model_fit2 = auto_arima(
-            data2,
-            start_p=1,
-            start_q=1,
-            max_p=3,
-            max_q=3,
-            m=12,
-            start_P=1,
-            seasonal=True,
-            d=None,
-            D=1,
-            trace=False,
-            error_action="ignore",  # Ignore incompatible settings
-            suppress_warnings=True,
-            stepwise=True,
-        )
+            model_fit2 = auto_arima(
+                data2,
+                start_p=1,
+                start_q=1,
+                max_p=3,
+                max_q=3,
+                m=12,
+                start_P=1,
+                seasonal=True,
+                d=None,
+                D=1,
+                trace=False,
+                error_action="ignore",  # Ignore incompatible settings
+                suppress_warnings=True,
+                stepwise=True,
+            )
+        else:
+            raise ValueError("search must be 'stepwise' or 'parallel'.")
 
         forecast_data = model_fit.predict(n_periods)
 
-        forecast_index = [n + 2019 for n in range(n_periods)]
+        # The predictions start the year after the last observed one
+        first_year = aux["year"].max().year + 1
+        forecast_index = [n + first_year for n in range(n_periods)]
         forecast_index = pd.to_datetime(forecast_index, format="%Y")
 
         forecast_data2 = model_fit2.predict(n_periods)
 
-        forecast_index2 = [n + 2019 for n in range(n_periods)]
+        forecast_index2 = [n + first_year for n in range(n_periods)]
         forecast_index2 = pd.to_datetime(forecast_index2, format="%Y")
 
         plt.subplot(1, 2, 1)
@@ -748,3 +920,11 @@ class EnergyAnalysis:
         plt.ylabel("Emissions (in tones of CO2)", fontsize=14)
         plt.plot(x2, data2)
         plt.plot(forecast_index2, forecast_data2)
+
+        return pd.DataFrame(
+            {
+                "year": forecast_index,
+                "total_consumption": np.asarray(forecast_data),
+                "total_emissions": np.asarray(forecast_data2),
+            }
+        )
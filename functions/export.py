@@ -0,0 +1,312 @@
+"""
+Columnar export of the analysis results as Arrow record batches or Parquet files.
+
+The numeric columns of the dataset are handed to Arrow without copying, and the
+results are produced and written batch by batch (and partition by partition),
+so large exports do not build full intermediate pandas copies.
+
+pyarrow is part of the group17 environment, but is only imported when exporting.
+"""
+
+import os
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from emissions import EMISSION_FACTORS
+from result_cache import capture_figures
+
+DATASETS = ["enriched", "mix_shares", "cross_section", "metrics", "forecast"]
+
+# Columns of the per-year cross-sections, as compared by gapminder and Emissions_Consumption
+CROSS_SECTION_COLUMNS = [
+    "country",
+    "iso_code",
+    "year",
+    "population",
+    "gdp",
+    "total_consumption",
+    "total_emissions",
+]
+
+MIX_COLUMNS = [source + "_consumption" for source in EMISSION_FACTORS] + [
+    "other_renewable_consumption"
+]
+
+
+def _pyarrow():
+    """
+    Imports pyarrow, with a helpful message if it is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "Exporting needs pyarrow: conda install -c conda-forge pyarrow"
+        ) from error
+    return pyarrow
+
+
+def to_table(df: pd.DataFrame, columns: list = None):
+    """
+    Converts a dataframe to an Arrow table. The numeric and date columns are
+    shared with the dataframe instead of copied.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        Data to convert
+    columns: list
+        Columns to keep, all of them if None
+    Returns
+    ----------------
+    pyarrow.Table
+    """
+    pa = _pyarrow()
+    if columns is None:
+        columns = list(df.columns)
+    arrays = [pa.array(df[column].to_numpy(), from_pandas=True) for column in columns]
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _mix_shares(batch):
+    """
+    Replaces the consumption columns of a batch by their share (in %) of the total consumption.
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+    total = batch.column(batch.schema.get_field_index("total_consumption"))
+    arrays, names = [], []
+    for name, array in zip(batch.schema.names, batch.columns):
+        if name in MIX_COLUMNS:
+            array = pc.multiply(pc.divide(array, total), 100)
+            name = name.replace("_consumption", "_share")
+        arrays.append(array)
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def _drop_column(batch, name: str):
+    """
+    Returns a batch without one of its columns.
+    """
+    pa = _pyarrow()
+    kept = [i for i, field in enumerate(batch.schema.names) if field != name]
+    return pa.RecordBatch.from_arrays(
+        [batch.column(i) for i in kept], names=[batch.schema.names[i] for i in kept]
+    )
+
+
+def forecast_frame(analysis, countries: list, n_periods: int, **options):
+    """
+    Runs the forecast of several countries and gathers the results in one dataframe.
+    The forecast plots are closed instead of shown.
+    Parameters
+    ----------------
+    analysis: EnergyAnalysis
+        The analysis object
+    countries: list
+        Names of the countries
+    n_periods: int
+        Number of prediction periods
+    **options:
+        Other arguments of EnergyAnalysis.forecast, e.g. search="parallel"
+    Raises
+    ----------------
+    ValueError
+        If a country has no iso code
+    Returns
+    ----------------
+    pandas dataframe
+    """
+    df = analysis.df
+    frames = []
+    for country in countries:
+        iso_codes = df.loc[df["country"] == country, "iso_code"].dropna()
+        if iso_codes.empty:
+            raise ValueError(f"No iso code for {country}.")
+        with capture_figures() as created:
+            plt.figure()
+            frame = analysis.forecast(n_periods, iso_codes.iloc[0], **options)
+        for number in created:
+            plt.close(number)
+        frame.insert(0, "country", country)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def record_batches(
+    analysis,
+    dataset: str = "enriched",
+    partition_by: str = None,
+    batch_size: int = 65536,
+    countries: list = None,
+    n_periods: int = 5,
+    **options,
+):
+    """
+    Streams a dataset of the analysis as Arrow record batches.
+    Parameters
+    ----------------
+    analysis: EnergyAnalysis
+        The analysis object
+    dataset: str
+        "enriched" (object.df), "mix_shares" (share of every source in the
+        consumption), "cross_section" (the per-year comparison of the countries),
+        "metrics" (object.derived_metrics()) or "forecast"
+    partition_by: str
+        "country" or "year" to yield the batches of each partition together
+    batch_size: int
+        Largest number of rows of a batch
+    countries: list
+        Countries to export (needed for "forecast"), all of them if None
+    n_periods: int
+        Number of prediction periods of "forecast"
+    **options:
+        Other arguments of EnergyAnalysis.forecast
+    Raises
+    ----------------
+    ValueError
+        If the dataset or the partitioning is unknown
+    Returns
+    ----------------
+    generator
+        (partition value, pyarrow.RecordBatch) pairs; the value is None if not partitioned
+    Example
+    ----------------
+    for year, batch in record_batches(object, "cross_section", partition_by="year"):
+        ...
+    """
+    pa = _pyarrow()
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}', use one of {DATASETS}.")
+    if partition_by not in (None, "country", "year"):
+        raise ValueError("partition_by must be None, 'country' or 'year'.")
+
+    if dataset == "forecast":
+        if countries is None:
+            raise ValueError("The forecast export needs a list of countries.")
+        df = forecast_frame(analysis, countries, n_periods, **options)
+    elif dataset == "metrics":
+        df = analysis.derived_metrics(countries=countries)
+    else:
+        df = analysis.df
+
+    columns = None
+    if dataset == "cross_section":
+        columns = [column for column in CROSS_SECTION_COLUMNS if column in df.columns]
+    elif dataset == "mix_shares":
+        columns = ["country", "year"] + MIX_COLUMNS + ["total_consumption"]
+    table = to_table(df, columns)
+    if countries is not None and dataset not in ("forecast", "metrics"):
+        # Filtered in Arrow, filtering df would copy the whole dataset
+        selected = pa.compute.is_in(
+            table.column("country"), value_set=pa.array(countries)
+        )
+        table = table.filter(selected)
+
+    if partition_by is None:
+        partitions = [(None, table)]
+    else:
+        keys = table.column(partition_by)
+        if partition_by == "year" and pa.types.is_timestamp(keys.type):
+            keys = pa.compute.year(keys)
+        keys = keys.to_numpy()
+        partitions = (
+            (key, table.take(pa.array(positions)))
+            for key, positions in pd.Series(keys).groupby(keys).indices.items()
+        )
+
+    for key, part in partitions:
+        for batch in part.to_batches(max_chunksize=batch_size):
+            yield key, _mix_shares(batch) if dataset == "mix_shares" else batch
+
+
+def write_parquet(analysis, path: str, dataset: str = "enriched", **options):
+    """
+    Writes a dataset of the analysis to Parquet, batch by batch. Partitioned
+    exports are written as one folder per partition (path/year=2010/part-0.parquet);
+    like Hive, the folder names hold the partition column, so
+    pyarrow.parquet.read_table(path) reads the whole export back.
+    Parameters
+    ----------------
+    analysis: EnergyAnalysis
+        The analysis object
+    path: str
+        File (not partitioned) or folder (partitioned) to write
+    dataset: str
+        See record_batches
+    **options:
+        partition_by, batch_size, countries, n_periods and forecast arguments,
+        see record_batches
+    Returns
+    ----------------
+    list
+        The paths of the files written
+    Example
+    ----------------
+    write_parquet(object, "./export/mix", "mix_shares", partition_by="country")
+    """
+    pq = _pyarrow().parquet
+    partition_by = options.get("partition_by")
+    paths = []
+    writer = None
+    current = None
+    try:
+        for key, batch in record_batches(analysis, dataset, **options):
+            if partition_by is not None:
+                batch = _drop_column(batch, partition_by)
+            if writer is None or key != current:
+                # Partitions come one after the other, close the previous one
+                if writer is not None:
+                    writer.close()
+                if partition_by is None:
+                    file_path = path
+                else:
+                    value = str(key).replace(os.sep, "_")
+                    file_path = os.path.join(
+                        path, f"{partition_by}={value}", "part-0.parquet"
+                    )
+                os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+                writer = pq.ParquetWriter(file_path, batch.schema)
+                current = key
+                paths.append(file_path)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return paths
+
+
+def write_arrow_stream(analysis, sink, dataset: str = "enriched", **options):
+    """
+    Writes a dataset of the analysis in the Arrow IPC streaming format.
+    Parameters
+    ----------------
+    analysis: EnergyAnalysis
+        The analysis object
+    sink: str or file-like
+        Where to write the stream
+    dataset: str
+        See record_batches
+    **options:
+        See record_batches; partition_by only changes the order of the rows
+    Returns
+    ----------------
+    int
+        Number of rows written
+    """
+    pa = _pyarrow()
+    n_rows = 0
+    writer = None
+    try:
+        for _, batch in record_batches(analysis, dataset, **options):
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
@@ -0,0 +1,274 @@
+"""
+Out-of-core processing of large energy datasets.
+
+The OWID energy table fits in memory, but monthly or sub-national series do not.
+This module stores such datasets as one csv file per country and year::
+
+    root/country=Germany/year=2010.csv
+
+and streams over the partitions, one at a time per worker, to enrich them with
+emissions and total consumption and to aggregate them.
+"""
+
+import os
+
+import pandas as pd
+from joblib import Parallel, delayed
+
+from emissions import EMISSION_FACTORS, add_emissions, add_total_consumption
+
+# Default amount of memory (in bytes) the workers may use together
+DEFAULT_MEMORY_BUDGET = 2 * 1024**3
+
+# How much bigger a partition gets in memory compared to its size on disk,
+# once it is parsed and enriched with the emission columns
+MEMORY_EXPANSION = 6
+
+# Aggregations that can be computed chunk by chunk and combined afterwards
+COMBINE = {"sum": "sum", "min": "min", "max": "max", "count": "sum"}
+
+
+def partition_path(root: str, country: str, year: int):
+    """
+    Returns the path of the file holding the data of a country in a year.
+    Parameters
+    ----------------
+    root: str
+        Folder of the partitioned dataset
+    country: str
+        Name of the country
+    year: int
+        Year of the partition
+    Returns
+    ----------------
+    str
+    """
+    country = str(country).replace(os.sep, "_")
+    return os.path.join(root, f"country={country}", f"year={year}.csv")
+
+
+def write_partitions(source: str, root: str, chunksize: int = 500_000):
+    """
+    Splits a csv file into one file per country and year without loading it whole.
+    The source is read in chunks of rows and every chunk is appended to the
+    partitions it touches; existing partitions of the same countries and years
+    are replaced.
+    Parameters
+    ----------------
+    source: str
+        Path of the csv file to split, it needs a country and a year column
+    root: str
+        Folder where the partitions are written
+    chunksize: int
+        Number of rows read from the source at a time
+    Returns
+    ----------------
+    list
+        The paths of the partitions written
+    Example
+    ----------------
+    write_partitions("./downloads/energy_data.csv", "./partitions/")
+    """
+    written = set()
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        for (country, year), part in chunk.groupby(["country", "year"], sort=False):
+            path = partition_path(root, country, year)
+            # A partition left by an earlier run is overwritten, not appended to
+            new = path not in written
+            if new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            part.to_csv(path, mode="w" if new else "a", header=new, index=False)
+            written.add(path)
+    return sorted(written)
+
+
+def list_partitions(root: str, countries: list = None, years: tuple = None):
+    """
+    Lists the partitions of a dataset, optionally only some countries and years.
+    Parameters
+    ----------------
+    root: str
+        Folder of the partitioned dataset
+    countries: list
+        Countries to keep, all of them if None
+    years: tuple
+        First and last year (both included) to keep, all of them if None
+    Returns
+    ----------------
+    list
+        Tuples of (country, year, path)
+    """
+    partitions = []
+    for country_dir in sorted(os.listdir(root)):
+        if not country_dir.startswith("country="):
+            continue
+        country = country_dir[len("country=") :]
+        if countries is not None and country not in countries:
+            continue
+        for file_name in sorted(os.listdir(os.path.join(root, country_dir))):
+            if not (file_name.startswith("year=") and file_name.endswith(".csv")):
+                continue
+            year = int(file_name[len("year=") : -len(".csv")])
+            if years is not None and not years[0] <= year <= years[1]:
+                continue
+            partitions.append(
+                (country, year, os.path.join(root, country_dir, file_name))
+            )
+    return partitions
+
+
+def enrich(df):
+    """
+    Adds the emission and total consumption columns to a partition,
+    the same way EnergyAnalysis does it for the whole dataset.
+    Parameters
+    ----------------
+    df: pandas dataframe
+        The rows of one partition
+    Returns
+    ----------------
+    pandas dataframe
+    """
+    return add_total_consumption(add_emissions(df))
+
+
+def _rows_per_chunk(path: str, memory_budget: int):
+    """
+    Estimates how many rows of a partition fit in the memory budget, None if all of them do.
+    """
+    size = os.path.getsize(path) * MEMORY_EXPANSION
+    if size <= memory_budget:
+        return None
+    with open(path) as f:
+        n_rows = sum(1 for _ in f) - 1
+    return max(1, int(n_rows * memory_budget / size))
+
+
+def _process_partition(path, columns, aggregations, memory_budget, output_path):
+    """
+    Enriches and aggregates one partition, in chunks if it does not fit in memory.
+    """
+    chunksize = _rows_per_chunk(path, memory_budget)
+    chunks = (
+        pd.read_csv(path, chunksize=chunksize) if chunksize else [pd.read_csv(path)]
+    )
+    partial = []
+    for i, chunk in enumerate(chunks):
+        chunk = enrich(chunk)
+        if output_path is not None:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            chunk.to_csv(output_path, mode="a" if i else "w", header=not i, index=False)
+        partial.append(chunk.groupby(["country", "year"])[columns].agg(aggregations))
+    if len(partial) == 1:
+        return partial[0]
+    combine = {
+        (column, aggregation): COMBINE[aggregation]
+        for column in columns
+        for aggregation in aggregations
+    }
+    return pd.concat(partial).groupby(level=["country", "year"]).agg(combine)
+
+
+def process_partitions(
+    root: str,
+    columns: list = None,
+    aggregations: list = None,
+    countries: list = None,
+    years: tuple = None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    n_jobs: int = -1,
+    output_root: str = None,
+):
+    """
+    Streams over a partitioned dataset: every partition is loaded, enriched with
+    the emissions and total consumption and reduced to one row per country and year.
+    The partitions are spread over all the cores, but never more workers run
+    than the memory budget allows. A partition bigger than its share of the budget
+    is processed in chunks of rows.
+    Parameters
+    ----------------
+    root: str
+        Folder of the partitioned dataset
+    columns: list
+        Columns to aggregate, by default the consumptions and the totals
+    aggregations: list
+        Any of "sum", "min", "max" and "count", by default ["sum"]
+    countries: list
+        Countries to process, all of them if None
+    years: tuple
+        First and last year (both included) to process, all of them if None
+    memory_budget: int
+        Memory, in bytes, the workers may use together
+    n_jobs: int
+        Maximum number of workers, -1 uses all the cores
+    output_root: str
+        If given, the enriched partitions are also written there
+    Raises
+    ----------------
+    ValueError
+        If an aggregation cannot be computed by parts
+    Returns
+    ----------------
+    pandas dataframe
+        Aggregates indexed by country and year
+    Example
+    ----------------
+    process_partitions("./partitions/", countries=["Portugal"], years=(1970, 2019))
+    """
+    if columns is None:
+        columns = [source + "_consumption" for source in EMISSION_FACTORS]
+        columns += [
+            "other_renewable_consumption",
+            "total_consumption",
+            "total_emissions",
+        ]
+    if aggregations is None:
+        aggregations = ["sum"]
+    for aggregation in aggregations:
+        if aggregation not in COMBINE:
+            raise ValueError(f"Aggregation '{aggregation}' is not supported.")
+
+    partitions = list_partitions(root, countries, years)
+    if not partitions:
+        return pd.DataFrame()
+
+    n_cores = os.cpu_count() if n_jobs == -1 else n_jobs
+    largest = max(os.path.getsize(path) for _, _, path in partitions)
+    n_workers = int(max(1, min(n_cores, memory_budget // (largest * MEMORY_EXPANSION))))
+    worker_budget = memory_budget // n_workers
+
+    results = Parallel(n_jobs=n_workers)(
+        delayed(_process_partition)(
+            path,
+            columns,
+            aggregations,
+            worker_budget,
+            None if output_root is None else partition_path(output_root, country, year),
+        )
+        for country, year, path in partitions
+    )
+    return pd.concat(results).sort_index()
+
+
+def load_partitions(root: str, countries: list = None, years: tuple = None):
+    """
+    Loads and enriches only the selected partitions into one dataframe,
+    for analyses that need the rows rather than the aggregates.
+    Parameters
+    ----------------
+    root: str
+        Folder of the partitioned dataset
+    countries: list
+        Countries to load, all of them if None
+    years: tuple
+        First and last year (both included) to load, all of them if None
+    Returns
+    ----------------
+    pandas dataframe
+    """
+    partitions = list_partitions(root, countries, years)
+    if not partitions:
+        return pd.DataFrame()
+    return pd.concat(
+        [enrich(pd.read_csv(path)) for _, _, path in partitions], ignore_index=True
+    )
@@ -0,0 +1,247 @@
+"""
+Disk-backed memoization of computed tables and rendered figures.
+
+Every entry is one file in the cache folder, named after a hash of the method,
+its arguments and the versions of the data it was computed from. The
+modification time of a file is its last access, so the least recently used
+entries can be evicted when the folder grows over its size cap, and several
+processes can share the same folder.
+"""
+
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+
+import matplotlib.pyplot as plt
+
+
+@contextmanager
+def capture_figures():
+    """
+    Stops plt.show() from displaying or closing the figures drawn inside the block.
+    Yields the list of figure numbers created in the block, filled when it exits.
+    """
+    before = set(plt.get_fignums())
+    created = []
+    show = plt.show
+    plt.show = lambda *args, **kwargs: None
+    try:
+        yield created
+    finally:
+        plt.show = show
+        created.extend(n for n in plt.get_fignums() if n not in before)
+
+
+class ResultCache:
+    """
+    Stores computed tables (pickled) and rendered figures (png bytes) on disk.
+    Attributes
+    ----------------
+    folder: str
+        Folder where the entries are stored
+    max_bytes: int
+        Size cap of the folder, the least recently used entries are evicted above it
+    hits: int
+        Number of lookups answered from the cache
+    misses: int
+        Number of lookups that had to be computed
+    Methods
+    ----------------
+    key: Key method
+        Builds the key of an entry from the method, arguments and versions
+    get_or_compute: Table method
+        Returns a cached result or computes and stores it
+    get_or_render: Figure method
+        Returns cached png bytes or draws, renders and stores the figure
+    """
+
+    def __init__(self, folder: str = "./cache/", max_bytes: int = 256 * 1024**2):
+        """
+        Class constructor to inizialize the attributes of the class.
+        Parameters
+        ----------------
+        folder: str
+            Folder where the entries are stored
+        max_bytes: int
+            Size cap of the folder in bytes
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def key(method: str, args: tuple = (), kwargs: dict = None, versions: tuple = ()):
+        """
+        Builds the key of an entry.
+        Parameters
+        ----------------
+        method: str
+            Name of the method that produces the entry
+        args: tuple
+            Positional arguments of the call
+        kwargs: dict
+            Keyword arguments of the call
+        versions: tuple
+            Versions of the inputs, e.g. of the dataset and of the emission factors
+        Returns
+        ----------------
+        str
+        """
+        kwargs = sorted((kwargs or {}).items())
+        return hashlib.sha256(
+            repr((method, args, kwargs, versions)).encode()
+        ).hexdigest()
+
+    def _path(self, key: str, extension: str):
+        return os.path.join(self.folder, key + extension)
+
+    def _read(self, path: str):
+        """
+        Returns the content of an entry and marks it as used, None if it is missing.
+        """
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    def _write(self, path: str, content: bytes):
+        """
+        Writes an entry atomically and evicts old entries if the cap is exceeded.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the folder fits in max_bytes.
+        Parameters
+        ----------------
+        None
+        Returns
+        ----------------
+        int
+            Number of entries deleted
+        """
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        deleted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+        return deleted
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Returns the cached result for a key, or calls compute() and caches what it returns.
+        Parameters
+        ----------------
+        key: str
+            Key of the entry, see ResultCache.key
+        compute: callable
+            Function without arguments returning a picklable result (e.g. a dataframe)
+        Returns
+        ----------------
+        The result of compute()
+        """
+        path = self._path(key, ".pkl")
+        content = self._read(path)
+        if content is not None:
+            return pickle.loads(content)
+        result = compute()
+        self._write(path, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        return result
+
+    def get_or_render(self, key: str, draw, dpi: int = 100):
+        """
+        Returns the cached png of a figure, or calls draw() and caches the rendered figure.
+        draw() starts on a new figure, the last figure it leaves open is rendered
+        and all the figures it created are closed instead of shown.
+        Parameters
+        ----------------
+        key: str
+            Key of the entry, see ResultCache.key
+        draw: callable
+            Function without arguments that draws with matplotlib
+        dpi: int
+            Resolution of the png
+        Returns
+        ----------------
+        bytes
+            The png image
+        """
+        path = self._path(key, ".png")
+        content = self._read(path)
+        if content is not None:
+            return content
+        buffer = io.BytesIO()
+        try:
+            with capture_figures() as created:
+                # A new figure, so methods drawing on the current one leave the
+                # figures of the caller alone
+                plt.figure()
+                draw()
+            figure = plt.figure(created[-1])
+            figure.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+        finally:
+            for number in created:
+                plt.close(number)
+        content = buffer.getvalue()
+        self._write(path, content)
+        return content
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and the current size of the cache.
+        Parameters
+        ----------------
+        None
+        Returns
+        ----------------
+        dict
+        """
+        entries = [e for e in os.scandir(self.folder) if e.is_file()]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(e.stat().st_size for e in entries),
+        }
+
+    def clear(self):
+        """
+        Deletes every entry and resets the counters.
+        Parameters
+        ----------------
+        None
+        Returns
+        ----------------
+        None
+        """
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                os.remove(entry.path)
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules live in functions/ and import each other by name, like in the notebook
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "functions"))
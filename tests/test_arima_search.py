@@ -0,0 +1,62 @@
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+import arima_search
+
+
+def test_rounds_go_from_simple_to_complex():
+    rounds = arima_search.candidate_orders(1, 1, 1, 1, d=1, D=1, m=4)
+    assert len(rounds) == 5
+    assert rounds[0] == [((0, 1, 0), (0, 1, 0, 4))]
+    assert sum(len(r) for r in rounds) == 16
+
+
+def test_target_stops_when_its_criterion_plateaus():
+    y = np.random.default_rng(0).normal(size=48)
+    models, report = arima_search.search(
+        {"noise": y},
+        m=4,
+        max_p=1,
+        max_q=1,
+        max_P=1,
+        max_Q=1,
+        patience=1,
+        tolerance=1e9,
+        n_jobs=2,
+    )
+    # The first round improves on nothing, the second does not improve enough
+    complexity = [
+        order[0] + order[2] + seasonal[0] + seasonal[2]
+        for order, seasonal in zip(report["order"], report["seasonal_order"])
+    ]
+    assert set(complexity) == {0, 1}
+    assert list(report.columns) == [
+        "target",
+        "order",
+        "seasonal_order",
+        "status",
+        "criterion",
+        "seconds",
+    ]
+    assert (report["status"] == "ok").all()
+    best = report.loc[report["criterion"].idxmin()]
+    assert models["noise"].order == best["order"]
+
+
+def test_search_stops_running_fits_at_the_budget():
+    rng = np.random.default_rng(0)
+    steps = np.arange(600)
+    y = np.cumsum(rng.normal(size=600)) + 10 * np.sin(steps * 2 * np.pi / 12)
+    start = time.perf_counter()
+    _, report = arima_search.search({"a": y, "b": 2 * y}, time_budget=2, n_jobs=2)
+    assert time.perf_counter() - start < 4
+    assert "timeout" in set(report["status"])
+    assert multiprocessing.active_children() == []
+
+
+def test_no_model_within_the_budget():
+    with pytest.raises(ValueError):
+        arima_search.search({"a": np.arange(30.0)}, time_budget=0)
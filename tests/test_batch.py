@@ -0,0 +1,34 @@
+import json
+
+import batch
+
+
+def test_expand_jobs():
+    spec = {
+        "countries": ["Portugal", "Chile"],
+        "years": [2010],
+        "horizons": [5, 10],
+        "analyses": ["gapminder", "forecast"],
+    }
+    ids = [job["id"] for job in batch.expand_jobs(spec)]
+    assert ids == [
+        "gapminder-2010",
+        "forecast-Portugal-5",
+        "forecast-Portugal-10",
+        "forecast-Chile-5",
+        "forecast-Chile-10",
+    ]
+
+
+def test_checkpoint_keeps_only_finished_jobs(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    lines = [
+        json.dumps({"id": "gapminder-2010", "status": "ok", "data_version": "v2"}),
+        json.dumps({"id": "forecast-Chile-5", "status": "error", "data_version": "v2"}),
+        json.dumps({"id": "forecast-Portugal-5", "status": "ok", "data_version": "v1"}),
+        '{"id": "forecast-Chile-10", "sta',
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    assert batch.read_checkpoint(str(path), "v2") == {"gapminder-2010"}
+    assert batch.read_checkpoint(str(path), "v1") == {"forecast-Portugal-5"}
+    assert batch.read_checkpoint(str(tmp_path / "missing.jsonl"), "v2") == set()
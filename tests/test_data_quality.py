@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_quality
+
+
+def test_fill_interpolates_gaps_within_each_country():
+    df = pd.DataFrame(
+        {
+            "country": ["A"] * 4 + ["B"] * 3,
+            "year": [2000, 2001, 2002, 2003, 2000, 2001, 2002],
+            "coal_consumption": [1, np.nan, 3, np.nan, np.nan, 10, 20],
+        }
+    )
+    filled, report = data_quality.assess(df)
+    assert filled["coal_consumption"].tolist() == [1, 2, 3, 0, 0, 10, 20]
+    assert report.gaps["coal_consumption"].tolist() == [0, 1, 0, 0, 0, 0, 0]
+    assert report.filled["coal_consumption"].tolist() == [0, 1, 0, 0, 0, 0, 0]
+
+
+def test_outliers_at_the_ends_keep_their_value():
+    values = [500, 10, 11, 12, 100, 12, 11, 10, 400]
+    df = pd.DataFrame(
+        {"country": "A", "year": range(2000, 2009), "coal_consumption": values}
+    )
+    filled, report = data_quality.assess(df, replace_outliers=True)
+    coal = filled["coal_consumption"].tolist()
+    assert coal[0] == 500 and coal[-1] == 400
+    assert coal[4] == 12
+    assert report.filled["coal_consumption"].tolist() == [
+        value != coal[i] for i, value in enumerate(values)
+    ]
+
+
+def test_effective_options_fill_in_the_defaults():
+    assert data_quality.effective_options() == data_quality.effective_options(
+        interpolation="linear"
+    )
+
+
+def test_other_methods_interpolate_over_the_years_of_one_country():
+    df = pd.DataFrame(
+        {
+            "country": ["A"] * 4 + ["B"] * 4,
+            "year": [2000, 2001, 2002, 2004] * 2,
+            "coal_consumption": [0, 1, np.nan, 16, 900, 800, np.nan, 5],
+        }
+    )
+    filled, _ = data_quality.assess(
+        df, interpolation="polynomial", interpolation_options={"order": 2}
+    )
+    coal = filled["coal_consumption"]
+    assert coal[2] == pytest.approx(4)
+    parabola = np.polyfit([0, 1, 4], [900, 800, 5], 2)
+    assert coal[6] == pytest.approx(np.polyval(parabola, 2))
+
+
+def test_reassess_matches_a_fresh_assessment():
+    raw = pd.DataFrame(
+        {
+            "country": ["A"] * 4 + ["B"] * 3,
+            "year": [2000, 2001, 2002, 2003, 2000, 2001, 2002],
+            "coal_consumption": [1, np.nan, 3, np.nan, np.nan, 10, 20],
+        }
+    )
+    filled, report = data_quality.assess(raw)
+    rows = pd.DataFrame(
+        {"country": "A", "year": [2002, 2004], "coal_consumption": [5.0, 7.0]},
+        index=[2, 7],
+    )
+    changed = pd.concat([filled, rows.loc[[7]]])
+    changed.update(rows.loc[[2]])
+    expected_raw = pd.concat([raw, rows.loc[[7]]])
+    expected_raw.update(rows.loc[[2]])
+
+    updated, merged = data_quality.reassess(changed, report, rows.notna())
+    expected, fresh = data_quality.assess(expected_raw)
+    pd.testing.assert_frame_equal(updated.sort_index(), expected, check_dtype=False)
+    assert updated["coal_consumption"].sort_index().tolist()[:4] == [1, 3, 5, 6]
+    for name in ["gaps", "missing", "filled"]:
+        pd.testing.assert_frame_equal(getattr(merged, name), getattr(fresh, name))
+    pd.testing.assert_series_equal(merged.no_consumption, fresh.no_consumption)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from derived_metrics import METRICS, DerivedMetrics, Metric
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    rows = []
+    for country in ["Portugal", "Chile"]:
+        for year in range(2000, 2010):
+            rows.append(
+                {
+                    "country": country,
+                    "year": pd.Timestamp(year=year, month=1, day=1),
+                    "gdp": rng.random() * 1e11,
+                    "population": rng.random() * 1e7,
+                    "total_consumption": rng.random() * 100,
+                    "total_emissions": rng.random() * 1e8,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def assert_same_as_fresh(metrics):
+    fresh = DerivedMetrics(metrics.df.copy()).frame()
+    pd.testing.assert_frame_equal(metrics.frame(), fresh)
+
+
+def test_update_changed_rows(df):
+    metrics = DerivedMetrics(df)
+    metrics.frame()
+    metrics.update(pd.DataFrame({"gdp": [1e12], "total_emissions": [5e8]}, index=[3]))
+    assert_same_as_fresh(metrics)
+
+
+def test_update_appended_rows(df):
+    metrics = DerivedMetrics(df)
+    metrics.frame()
+    new = df.iloc[[9]].copy()
+    new.index = [100]
+    new["year"] = pd.Timestamp("2010-01-01")
+    new["total_consumption"] = 500
+    metrics.update(new)
+    assert len(metrics.frame()) == len(df) + 1
+    assert_same_as_fresh(metrics)
+
+
+def test_update_only_recomputes_affected_rows(df):
+    computed = {}
+
+    def counted(metric):
+        def function(inputs):
+            computed.setdefault(metric.name, []).extend(inputs.index)
+            return metric.function(inputs)
+
+        return Metric(metric.name, metric.inputs, function, metric.by_country)
+
+    metrics = DerivedMetrics(df, [counted(metric) for metric in METRICS])
+    metrics.frame()
+    computed.clear()
+    metrics.update(pd.DataFrame({"population": [1e6]}, index=[3]))
+    metrics.frame()
+    assert computed == {"consumption_per_capita": [3]}
+    assert_same_as_fresh(metrics)
+
+
+def test_cycle_is_rejected(df):
+    with pytest.raises(ValueError):
+        DerivedMetrics(df, [Metric("a", ["b"], None), Metric("b", ["a"], None)])
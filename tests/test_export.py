@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import export
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(0)
+    rows = []
+    for country, iso_code in [("Portugal", "PRT"), ("Chile", "CHL"), ("World", None)]:
+        for year in range(2000, 2004):
+            row = {
+                "country": country,
+                "iso_code": iso_code,
+                "year": pd.Timestamp(year=year, month=1, day=1),
+            }
+            for column in export.MIX_COLUMNS:
+                row[column] = rng.random() * 10
+            rows.append(row)
+    df = pd.DataFrame(rows)
+    df["total_consumption"] = df[export.MIX_COLUMNS].sum(axis=1)
+    return SimpleNamespace(df=df)
+
+
+def test_partitions_round_trip(analysis, tmp_path):
+    root = str(tmp_path / "enriched")
+    paths = export.write_parquet(
+        analysis, root, partition_by="year", countries=["Portugal", "Chile"]
+    )
+    assert len(paths) == 4
+    back = pq.read_table(root).to_pandas()
+    assert sorted(back["year"].astype(int).unique()) == [2000, 2001, 2002, 2003]
+    expected = analysis.df[analysis.df["country"] != "World"]
+    columns = ["country", "coal_consumption", "total_consumption"]
+    pd.testing.assert_frame_equal(
+        back[columns]
+        .astype({"country": str})
+        .sort_values(columns)
+        .reset_index(drop=True),
+        expected[columns].sort_values(columns).reset_index(drop=True),
+    )
+
+
+def test_mix_shares_are_percentages_of_the_total(analysis, tmp_path):
+    path = str(tmp_path / "mix.parquet")
+    export.write_parquet(analysis, path, "mix_shares", countries=["Chile"])
+    shares = pq.read_table(path).to_pandas()
+    chile = analysis.df[analysis.df["country"] == "Chile"].reset_index(drop=True)
+    assert (shares["country"] == "Chile").all()
+    np.testing.assert_allclose(
+        shares["coal_share"],
+        chile["coal_consumption"] / chile["total_consumption"] * 100,
+    )
+    share_columns = [c.replace("_consumption", "_share") for c in export.MIX_COLUMNS]
+    np.testing.assert_allclose(shares[share_columns].sum(axis=1), 100)
+
+
+def test_forecast_of_a_country_without_iso_code(analysis):
+    with pytest.raises(ValueError, match="No iso code for World"):
+        export.forecast_frame(analysis, ["World"], 5)
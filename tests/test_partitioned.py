@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import partitioned
+from emissions import EMISSION_FACTORS
+
+
+@pytest.fixture
+def source(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = []
+    for country in ["Portugal", "Chile"]:
+        for year in range(2000, 2004):
+            for month in range(1, 13):
+                row = {"country": country, "year": year, "month": month}
+                for name in list(EMISSION_FACTORS) + ["other_renewable"]:
+                    row[name + "_consumption"] = rng.random()
+                rows.append(row)
+    path = tmp_path / "source.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def test_write_partitions_twice_does_not_duplicate(source, tmp_path):
+    root = str(tmp_path / "parts")
+    partitioned.write_partitions(source, root, chunksize=7)
+    paths = partitioned.write_partitions(source, root, chunksize=7)
+    assert len(paths) == 8
+    assert len(pd.read_csv(partitioned.partition_path(root, "Chile", 2001))) == 12
+
+
+def test_chunked_partitions_give_the_same_aggregates(source, tmp_path):
+    root = str(tmp_path / "parts")
+    partitioned.write_partitions(source, root)
+    aggregations = ["sum", "min", "max", "count"]
+    whole = partitioned.process_partitions(root, aggregations=aggregations, n_jobs=1)
+    chunked = partitioned.process_partitions(
+        root, aggregations=aggregations, n_jobs=1, memory_budget=2000
+    )
+    assert (whole.xs("count", axis=1, level=1) == 12).all().all()
+    pd.testing.assert_frame_equal(whole, chunked, check_dtype=False)
+
+
+def test_unsupported_aggregation(source, tmp_path):
+    with pytest.raises(ValueError):
+        partitioned.process_partitions(str(tmp_path), aggregations=["mean"])
@@ -0,0 +1,61 @@
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import pytest  # noqa: E402
+
+from result_cache import ResultCache  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache"), max_bytes=3500)
+
+
+def _age(cache, key, seconds):
+    path = os.path.join(cache.folder, key + ".pkl")
+    os.utime(path, (seconds, seconds))
+
+
+def test_hits_and_misses(cache):
+    calls = []
+    compute = lambda: calls.append(1) or [1, 2, 3]  # noqa: E731
+    assert cache.get_or_compute("a", compute) == [1, 2, 3]
+    assert cache.get_or_compute("a", compute) == [1, 2, 3]
+    assert cache.get_or_compute("b", compute) == [1, 2, 3]
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_evicts_least_recently_used_under_the_cap(cache):
+    for key, age in [("old", 1000), ("used", 2000), ("new", 3000)]:
+        cache.get_or_compute(key, lambda: b"x" * 1000)
+        _age(cache, key, age)
+    # Reading "old" makes it the most recently used entry
+    cache.get_or_compute("old", lambda: None)
+    cache.get_or_compute("extra", lambda: b"x" * 1000)
+
+    names = sorted(os.listdir(cache.folder))
+    assert names == ["extra.pkl", "new.pkl", "old.pkl"]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_render_leaves_the_caller_figures_alone(cache):
+    mine = plt.figure()
+    plt.plot([1, 2], [3, 4])
+
+    def draw():
+        plt.plot([1, 2, 3])
+        plt.show()
+
+    png = cache.get_or_render("figure", draw)
+    assert png.startswith(b"\x89PNG")
+    assert plt.get_fignums() == [mine.number]
+    assert plt.gcf() is mine
+    assert len(mine.axes[0].lines) == 1
+    assert cache.get_or_render("figure", draw) == png
+    plt.close(mine)